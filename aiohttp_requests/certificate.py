@@ -0,0 +1,122 @@
+import ssl
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import asyncio
+
+from logs.logger import logger
+from logs.logger_message import create_certificate_expiry_message
+
+
+@dataclass
+class CertificateInfo:
+    host: str
+    ip: str
+    not_after: datetime
+    checked_at: datetime
+
+    def days_left(self, now: datetime) -> int:
+        return (self.not_after - now).days
+
+
+def _read_tlv(data: bytes, offset: int) -> tuple[int, int, int]:
+    '''Возвращает тег, начало и конец значения DER-элемента'''
+    tag = data[offset]
+    length = data[offset + 1]
+    offset += 2
+    if length & 0x80:
+        size = length & 0x7F
+        length = int.from_bytes(data[offset:offset + size], 'big')
+        offset += size
+    return tag, offset, offset + length
+
+
+def _parse_asn1_time(tag: int, value: bytes) -> datetime:
+    text = value.decode('ascii')
+    fmt = '%y%m%d%H%M%SZ' if tag == 0x17 else '%Y%m%d%H%M%SZ'
+    return datetime.strptime(text, fmt).replace(tzinfo=timezone.utc)
+
+
+def parse_not_after(der: bytes) -> datetime:
+    '''Достаёт notAfter из DER-сертификата без сторонних библиотек'''
+    _, start, _ = _read_tlv(der, 0)            # Certificate
+    _, offset, _ = _read_tlv(der, start)       # TBSCertificate
+    tag, _, end = _read_tlv(der, offset)
+    if tag == 0xA0:                            # version [0] EXPLICIT
+        offset = end
+    for _ in range(3):                         # serialNumber, signature, issuer
+        _, _, offset = _read_tlv(der, offset)
+    _, offset, _ = _read_tlv(der, offset)      # validity
+    _, _, offset = _read_tlv(der, offset)      # notBefore
+    tag, value_start, value_end = _read_tlv(der, offset)
+    return _parse_asn1_time(tag, der[value_start:value_end])
+
+
+def get_certificate_expiry(transport: asyncio.BaseTransport) -> Optional[datetime]:
+    '''Читает срок действия сертификата из уже установленного TLS-соединения'''
+    ssl_object: Optional[ssl.SSLObject] = transport.get_extra_info('ssl_object')
+    if ssl_object is None:
+        return None
+    cert = ssl_object.getpeercert()
+    if cert and 'notAfter' in cert:
+        return datetime.fromtimestamp(ssl.cert_time_to_seconds(cert['notAfter']), timezone.utc)
+    # При отключенной проверке сертификата getpeercert() возвращает пустой словарь
+    der = ssl_object.getpeercert(binary_form=True)
+    return parse_not_after(der) if der else None
+
+
+class CertificateMonitor:
+    '''Кэширует сроки сертификатов по (host, ip) и шлёт уведомления при пересечении порогов.
+    Отправленные пороги хранятся по (host, not_after), чтобы хост за несколькими IP
+    с одним сертификатом давал один алерт'''
+    def __init__(self,
+                 telegram_bot,
+                 refresh_interval=12,
+                 thresholds=(30, 7, 1)):
+        self.telegram_bot = telegram_bot
+        self.refresh_interval = timedelta(hours=refresh_interval)
+        self.thresholds = sorted(thresholds, reverse=True)
+        self.certificates: dict[tuple[str, str], CertificateInfo] = {}
+        self.alerted_thresholds: dict[tuple[str, datetime], set[int]] = {}
+
+    def needs_refresh(self, host: str, ip: str, now: datetime) -> bool:
+        info = self.certificates.get((host, ip))
+        return info is None or (now - info.checked_at) > self.refresh_interval
+
+    async def observe(self, host: str, transport: Optional[asyncio.BaseTransport]) -> None:
+        if transport is None:
+            return
+        peername = transport.get_extra_info('peername')
+        ip = peername[0] if peername else 'None'
+        now = datetime.now(timezone.utc)
+        if not self.needs_refresh(host, ip, now):
+            return
+        try:
+            not_after = get_certificate_expiry(transport)
+        except (ValueError, IndexError, ssl.SSLError) as e:
+            logger.warning(f"Could not read certificate of {host} ({ip}): {e}")
+            return
+        if not_after is None:
+            return
+        await self.update(host, ip, not_after, now)
+
+    async def update(self, host: str, ip: str, not_after: datetime, now: datetime) -> None:
+        info = self.certificates.get((host, ip))
+        if info is None or info.not_after != not_after:
+            info = CertificateInfo(host, ip, not_after, now)
+            self.certificates[(host, ip)] = info
+        info.checked_at = now
+        await self._alert_if_needed(info, now)
+
+    async def _alert_if_needed(self, info: CertificateInfo, now: datetime) -> None:
+        days_left = info.days_left(now)
+        crossed = [threshold for threshold in self.thresholds if days_left <= threshold]
+        alerted = self.alerted_thresholds.setdefault((info.host, info.not_after), set())
+        if not crossed or crossed[-1] in alerted:
+            return
+        # Один алерт на самый близкий порог, более дальние считаем уже пройденными
+        alerted.update(crossed)
+        message = create_certificate_expiry_message(info.host, days_left, info.not_after)
+        await self.telegram_bot.add_to_queue(message)
+        logger.warning(message)
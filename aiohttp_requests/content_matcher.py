@@ -0,0 +1,175 @@
+import codecs
+import json
+import os
+import re
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+from logs.logger import logger
+
+module_dir = os.path.dirname(__file__)
+
+
+class AhoCorasick:
+    '''Ищет сразу несколько подстрок за один проход по потоку символов'''
+    def __init__(self, patterns: list[str]):
+        self.patterns = patterns
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.output: list[set[int]] = [set()]
+        for index, pattern in enumerate(patterns):
+            self._add(pattern, index)
+        self._build_fail_links()
+
+    def _add(self, pattern: str, index: int) -> None:
+        state = 0
+        for char in pattern:
+            if char not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(set())
+                self.goto[state][char] = len(self.goto) - 1
+            state = self.goto[state][char]
+        self.output[state].add(index)
+
+    def _build_fail_links(self) -> None:
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                self.output[next_state] |= self.output[self.fail[next_state]]
+
+    def feed(self, state: int, chunk: str) -> tuple[int, set[int]]:
+        '''Возвращает новое состояние автомата и индексы найденных шаблонов.
+        Состояние переносится между чанками, поэтому совпадения на границе не теряются'''
+        found = set()
+        goto, fail, output = self.goto, self.fail, self.output
+        for char in chunk:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return state, found
+
+
+@dataclass
+class ContentRules:
+    must_contain: list[str] = field(default_factory=list)
+    must_not_contain: list[str] = field(default_factory=list)
+    must_match: list[str] = field(default_factory=list)
+    must_not_match: list[str] = field(default_factory=list)
+    case_sensitive: bool = False
+    max_bytes: int = 1024 * 1024
+    regex_window: int = 1024
+
+    def __post_init__(self):
+        keywords = self.must_contain + self.must_not_contain
+        self.matcher = AhoCorasick([self.fold(keyword) for keyword in keywords])
+        flags = 0 if self.case_sensitive else re.IGNORECASE
+        self.regexes = [re.compile(pattern, flags)
+                        for pattern in self.must_match + self.must_not_match]
+
+    def fold(self, text: str) -> str:
+        return text if self.case_sensitive else text.casefold()
+
+    def scanner(self, encoding: Optional[str] = None) -> 'ContentScanner':
+        return ContentScanner(self, encoding)
+
+
+class ContentScanner:
+    '''Проверяет тело ответа по мере чтения, не сохраняя его целиком.
+    Тело декодируется инкрементально в кодировке ответа (utf-8, если charset не указан),
+    поэтому сравнение без учёта регистра работает и для кириллицы.
+    Регулярные выражения ищутся в окне из хвоста предыдущего чанка и текущего чанка,
+    поэтому совпадения длиннее regex_window символов на границе чанков не гарантируются'''
+    def __init__(self, rules: ContentRules, encoding: Optional[str] = None):
+        self.rules = rules
+        self.decoder = self._get_decoder(encoding)
+        self.state = 0
+        self.tail = ''
+        self.bytes_read = 0
+        self.found_keywords: set[int] = set()
+        self.found_regexes: set[int] = set()
+        self.keywords_to_find = len(rules.must_contain)
+        self.regexes_to_find = len(rules.must_match)
+        self.unresolved_regexes = set(range(len(rules.regexes)))
+
+    @staticmethod
+    def _get_decoder(encoding: Optional[str]) -> codecs.IncrementalDecoder:
+        try:
+            return codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+        except LookupError:
+            logger.warning(f"Unknown charset {encoding}, decoding body as utf-8")
+            return codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def feed(self, data: bytes) -> None:
+        data = data[:self.rules.max_bytes - self.bytes_read]
+        self.bytes_read += len(data)
+        chunk = self.decoder.decode(data, final=self.exhausted)
+        if self.rules.matcher.patterns:
+            self.state, found = self.rules.matcher.feed(self.state, self.rules.fold(chunk))
+            self.found_keywords |= found
+        if self.unresolved_regexes:
+            window = self.tail + chunk
+            for index in list(self.unresolved_regexes):
+                if self.rules.regexes[index].search(window):
+                    self.found_regexes.add(index)
+                    self.unresolved_regexes.discard(index)
+            self.tail = window[-self.rules.regex_window:]
+
+    @property
+    def exhausted(self) -> bool:
+        return self.bytes_read >= self.rules.max_bytes
+
+    @property
+    def decided(self) -> bool:
+        '''Результат известен: найдено запрещённое или найдено всё обязательное
+        и запрещать нечего, либо исчерпан лимит байт'''
+        if self.exhausted or self._forbidden_found():
+            return True
+        if self.rules.must_not_contain or self.rules.must_not_match:
+            return False
+        return not self._missing_required()
+
+    def _forbidden_found(self) -> list[str]:
+        keywords = self.rules.must_contain + self.rules.must_not_contain
+        regexes = self.rules.must_match + self.rules.must_not_match
+        return ([keywords[i] for i in sorted(self.found_keywords) if i >= self.keywords_to_find] +
+                [regexes[i] for i in sorted(self.found_regexes) if i >= self.regexes_to_find])
+
+    def _missing_required(self) -> list[str]:
+        return ([keyword for i, keyword in enumerate(self.rules.must_contain)
+                 if i not in self.found_keywords] +
+                [pattern for i, pattern in enumerate(self.rules.must_match)
+                 if i not in self.found_regexes])
+
+    def result(self) -> Optional[str]:
+        '''None, если тело прошло проверку, иначе описание ошибки'''
+        forbidden = self._forbidden_found()
+        if forbidden:
+            return f"Forbidden content found: {forbidden}"
+        missing = self._missing_required()
+        if missing:
+            return f"Required content not found in {self.bytes_read} bytes: {missing}"
+        return None
+
+
+def load_content_rules(rules_file='content_rules.json') -> dict[str, ContentRules]:
+    '''Загружает правила вида {"https://site": {"must_contain": [...], ...}}'''
+    rules_file = os.path.join(module_dir, rules_file)
+    try:
+        with open(rules_file, 'r') as f:
+            data = json.load(f)
+        return {url: ContentRules(**rules) for url, rules in data.items()}
+    except FileNotFoundError:
+        return {}
+    except (json.JSONDecodeError, TypeError, re.error) as e:
+        logger.error(f"Invalid content rules in {rules_file}: {e}")
+        return {}
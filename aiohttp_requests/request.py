@@ -1,17 +1,20 @@
 import asyncio
 import socket
+import ssl
 import random
 from datetime import datetime, timezone
 import time
 from urllib.parse import urlparse
 from dataclasses import dataclass, field
-from typing import List, Optional, NamedTuple
+from typing import ClassVar, List, Optional, NamedTuple
 from functools import wraps
 
 import aiohttp
 import aiodns
 
 from aiohttp_requests.proxy import ProxyManager
+from aiohttp_requests.content_matcher import ContentRules
+from aiohttp_requests.certificate import CertificateMonitor
 from logs.logger import logger
 
 
@@ -49,14 +52,39 @@ def get_domain_from_url(url: str) -> str:
     return domain
 
 
+def create_trace_config() -> aiohttp.TraceConfig:
+    '''Замеряет фазы запроса в словарь, переданный через trace_request_ctx'''
+    async def on_dns_start(session, ctx, params):
+        ctx.dns_start = time.perf_counter()
+
+    async def on_dns_end(session, ctx, params):
+        if ctx.trace_request_ctx is not None:
+            ctx.trace_request_ctx['dns'] = time.perf_counter() - ctx.dns_start
+
+    async def on_connection_start(session, ctx, params):
+        ctx.connection_start = time.perf_counter()
+
+    async def on_connection_end(session, ctx, params):
+        if ctx.trace_request_ctx is not None:
+            ctx.trace_request_ctx['connect'] = time.perf_counter() - ctx.connection_start
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_dns_resolvehost_start.append(on_dns_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_end)
+    trace_config.on_connection_create_start.append(on_connection_start)
+    trace_config.on_connection_create_end.append(on_connection_end)
+    return trace_config
+
+
 async def create_session(need_connector=True,
                          pool_size=50,
                          limit_per_host=10) -> aiohttp.ClientSession:
+    trace_configs = [create_trace_config()]
     if need_connector:
         connector = aiohttp.TCPConnector(limit=pool_size, limit_per_host=limit_per_host)
-        session = aiohttp.ClientSession(connector=connector)
+        session = aiohttp.ClientSession(connector=connector, trace_configs=trace_configs)
     else:
-        session = aiohttp.ClientSession()
+        session = aiohttp.ClientSession(trace_configs=trace_configs)
     return session
 
 
@@ -77,6 +105,11 @@ class WebsiteChecker:
     session: Optional[aiohttp.ClientSession] = None
     headers: dict = field(init=False)
     proxy: Optional[str] = None
+    content_rules: Optional[ContentRules] = None
+    certificate_monitor: Optional[CertificateMonitor] = None
+    ssl_context: ssl.SSLContext | bool = True
+    timings: dict = field(init=False, default_factory=dict)
+    transport_missing_logged: ClassVar[bool] = False
 
     def __post_init__(self):
         self.headers = {
@@ -120,14 +153,24 @@ class WebsiteChecker:
         checked_at = datetime.now(timezone.utc).isoformat()
         status = 'Exception'
         response_time = 0
+        self.timings = {}
         try:
             async with session.get(self.url,
                                    headers=self.headers,
                                    timeout=60,
-                                   proxy=self.proxy) as response:
+                                   proxy=self.proxy,
+                                   ssl=self.ssl_context,
+                                   trace_request_ctx=self.timings) as response:
                 response_time = time.time() - start_time
                 status = response.status
+                if self.certificate_monitor:
+                    await self.certificate_monitor.observe(self.domain, self._get_transport(response))
                 if status == 200:
+                    if self.content_rules:
+                        # Обрыв или таймаут при чтении тела не должен давать UP
+                        status = 'ContentError'
+                        error = await self._check_content(response)
+                        status = 'ContentMismatch' if error else 200
                     return CheckResult(self.url, status, response_time, checked_at, error)
 
         except (aiohttp.ClientProxyConnectionError, aiohttp.ClientHttpProxyError) as ex:
@@ -147,6 +190,29 @@ class WebsiteChecker:
 
         return CheckResult(self.url, status, response_time, checked_at, error)
 
+    @classmethod
+    def _get_transport(cls, response: aiohttp.ClientResponse) -> Optional[asyncio.BaseTransport]:
+        '''Короткий ответ дочитывается вместе с заголовками, и aiohttp сразу возвращает
+        соединение в пул (response.connection == None), поэтому берём транспорт у протокола.
+        _protocol - приватный атрибут aiohttp: если он пропадёт, сертификаты перестанут
+        проверяться, поэтому об отсутствии транспорта пишем в лог один раз'''
+        protocol = getattr(response, '_protocol', None)
+        transport = protocol.transport if protocol is not None else None
+        if transport is None and not cls.transport_missing_logged:
+            WebsiteChecker.transport_missing_logged = True
+            logger.warning(f"No transport on aiohttp response for {response.url}, "
+                           f"certificate expiry is not monitored")
+        return transport
+
+    async def _check_content(self, response: aiohttp.ClientResponse) -> Optional[str]:
+        '''Читает тело чанками, пока не решены все проверки или не достигнут лимит байт'''
+        scanner = self.content_rules.scanner(response.charset)
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            scanner.feed(chunk)
+            if scanner.decided:
+                break
+        return scanner.result()
+
 
 if __name__ == '__main__':
     async def main():
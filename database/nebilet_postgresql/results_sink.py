@@ -0,0 +1,214 @@
+import json
+import os
+import shutil
+import socket
+from datetime import datetime, timedelta
+
+import asyncio
+import asyncpg
+
+from aiohttp_requests.request import CheckResult
+from database.nebilet_postgresql.database_nebilet import DBConnection
+
+COLUMNS = ['instance', 'url', 'status', 'response_time', 'checked_at', 'error']
+# Только после этих ошибок пачку есть смысл повторить: база недоступна, а не отвергла данные
+CONNECTION_ERRORS = (OSError, ConnectionError, asyncpg.InterfaceError, asyncpg.PostgresConnectionError)
+
+
+class PostgresResultSink:
+    '''Копит результаты проверок и пишет их пачками через COPY в таблицу,
+    секционированную по месяцам. Пока Postgres недоступен, пачки сбрасываются
+    в локальный файл и дописываются в базу после восстановления связи.
+    Пачки, которые база отвергла, и нечитаемые строки файла уходят в rejected_file;
+    оба файла ограничены max_spill_bytes'''
+    def __init__(self,
+                 db_connection: DBConnection,
+                 logger,
+                 table='uptime_check_results',
+                 instance=None,
+                 batch_size=500,
+                 flush_interval=30,
+                 max_buffer=5000,
+                 spill_file='results_spill.jsonl',
+                 rejected_file='results_rejected.jsonl',
+                 max_spill_bytes=100 * 1024 * 1024):
+        self.db_connection = db_connection
+        self.logger = logger
+        self.table = table
+        self.instance = instance or socket.gethostname()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.spill_file = DBConnection._get_backup_path(spill_file)
+        self.rejected_file = DBConnection._get_backup_path(rejected_file)
+        self.max_spill_bytes = max_spill_bytes
+        self.buffer: list[tuple] = []
+        self.partitions: set[str] = set()
+        self.table_created = False
+        self.lock = asyncio.Lock()
+
+    def add(self, result: CheckResult) -> None:
+        url, status, response_time, checked_at, error = result
+        self.buffer.append((self.instance, url, str(status), response_time,
+                            datetime.fromisoformat(checked_at), error))
+        if len(self.buffer) >= self.max_buffer:
+            self._spill(self.buffer)
+            self.buffer = []
+
+    @staticmethod
+    def _to_spill(record: tuple) -> bytes:
+        row = dict(zip(COLUMNS, record))
+        row['checked_at'] = row['checked_at'].isoformat()
+        return (json.dumps(row) + '\n').encode()
+
+    def _append_lines(self, path: str, lines: list[bytes]) -> None:
+        '''Дописывает строки в файл, не давая ему вырасти больше max_spill_bytes.
+        Если процесс упал посреди записи, недописанная строка закрывается переводом строки,
+        чтобы не склеиться со следующей'''
+        if not lines:
+            return
+        if os.path.exists(path) and os.path.getsize(path) >= self.max_spill_bytes:
+            self.logger.error(f"{path} reached {self.max_spill_bytes} bytes, dropping {len(lines)} check results")
+            return
+        with open(path, 'a+b') as f:
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+            f.writelines(lines)
+
+    def _spill(self, records: list[tuple]) -> None:
+        self._append_lines(self.spill_file, [self._to_spill(record) for record in records])
+
+    def _reject(self, records: list[tuple], error: Exception) -> None:
+        self.logger.error(f"{self.table} rejected {len(records)} check results, "
+                          f"moved to {self.rejected_file}: {error}")
+        self._append_lines(self.rejected_file, [self._to_spill(record) for record in records])
+
+    @staticmethod
+    def _from_spill(line: bytes) -> tuple:
+        row = json.loads(line)
+        row['checked_at'] = datetime.fromisoformat(row['checked_at'])
+        return tuple(row[column] for column in COLUMNS)
+
+    def _parse_spill(self, lines: list[bytes]) -> list[tuple]:
+        records, malformed = [], []
+        for line in lines:
+            try:
+                records.append(self._from_spill(line))
+            except (ValueError, KeyError, TypeError):
+                malformed.append(line.rstrip(b'\n') + b'\n')
+        if malformed:
+            self.logger.warning(f"Skipped {len(malformed)} malformed lines of {self.spill_file}, "
+                                f"moved to {self.rejected_file}")
+            self._append_lines(self.rejected_file, malformed)
+        return records
+
+    async def _ensure_partitions(self, records: list[tuple]) -> None:
+        '''Создаёт таблицу и секции отдельной транзакцией до COPY:
+        кэш обновляется только после коммита, чтобы откат не оставил в нём несуществующие секции'''
+        missing: dict[str, datetime] = {}
+        for record in records:
+            checked_at = record[4].replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            name = f"{self.table}_{checked_at:%Y_%m}"
+            if name not in self.partitions:
+                missing[name] = checked_at
+        if self.table_created and not missing:
+            return
+        async with self.db_connection.get_cursor() as conn:
+            await self._create_partitions(conn, missing)
+        self.table_created = True
+        self.partitions.update(missing)
+
+    async def _create_partitions(self, conn: asyncpg.Connection, partitions: dict[str, datetime]) -> None:
+        if not self.table_created:
+            await conn.execute(f'''CREATE TABLE IF NOT EXISTS {self.table} (
+                                       instance TEXT NOT NULL,
+                                       url TEXT NOT NULL,
+                                       status TEXT NOT NULL,
+                                       response_time DOUBLE PRECISION,
+                                       checked_at TIMESTAMPTZ NOT NULL,
+                                       error TEXT
+                                   ) PARTITION BY RANGE (checked_at)''')
+        for name, checked_at in partitions.items():
+            next_month = (checked_at + timedelta(days=32)).replace(day=1)
+            await conn.execute(f'''CREATE TABLE IF NOT EXISTS {name}
+                                   PARTITION OF {self.table}
+                                   FOR VALUES FROM ('{checked_at.isoformat()}')
+                                   TO ('{next_month.isoformat()}')''')
+
+    async def _copy(self, records: list[tuple]) -> None:
+        await self._ensure_partitions(records)
+        async with self.db_connection.get_cursor() as conn:
+            await conn.copy_records_to_table(self.table, records=records, columns=COLUMNS)
+
+    async def _export(self, records: list[tuple]) -> None:
+        '''Ошибки связи пробрасываются, чтобы пачка осталась в spill_file до восстановления;
+        прочие ошибки повтором не лечатся, поэтому пачка откладывается в rejected_file'''
+        if not records:
+            return
+        try:
+            await self._copy(records)
+        except CONNECTION_ERRORS:
+            raise
+        except (Exception, asyncpg.PostgresError) as e:
+            self._reject(records, e)
+
+    async def _replay_spill(self) -> None:
+        '''Дописывает сохранённые на диск записи; при ошибке в файле остаётся только неотправленное'''
+        if not os.path.exists(self.spill_file):
+            return
+        offset = 0
+        try:
+            with open(self.spill_file, 'rb') as f:
+                while True:
+                    lines = [line for line in (f.readline() for _ in range(self.batch_size)) if line]
+                    if not lines:
+                        break
+                    await self._export(self._parse_spill(lines))
+                    offset = f.tell()
+        except BaseException:
+            self._truncate_spill(offset)
+            raise
+        os.remove(self.spill_file)
+        self.logger.info(f"Replayed spilled check results into {self.table}")
+
+    def _truncate_spill(self, offset: int) -> None:
+        '''Отрезает уже отправленное начало файла, копируя остаток по частям'''
+        if not offset:
+            return
+        tmp_file = self.spill_file + '.tmp'
+        with open(self.spill_file, 'rb') as src, open(tmp_file, 'wb') as dst:
+            src.seek(offset)
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_file, self.spill_file)
+
+    async def flush(self, replay_spill=True) -> None:
+        async with self.lock:
+            records, self.buffer = self.buffer, []
+            try:
+                if replay_spill:
+                    await self._replay_spill()
+                while records:
+                    await self._export(records[:self.batch_size])
+                    records = records[self.batch_size:]
+            except CONNECTION_ERRORS as e:
+                self.logger.error(f"Postgres is unavailable, spilling check results for {self.table}: {e}")
+                self._spill(records)
+            except asyncio.CancelledError:
+                self._spill(records)
+                raise
+
+    async def run(self) -> None:
+        '''Периодически сбрасывает буфер; при остановке задачи выполняет последний flush'''
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        '''Последний flush при остановке без дозаписи файла: то, что не удалось записать в базу,
+        остаётся в файле до следующего запуска'''
+        await self.flush(replay_spill=False)
@@ -16,3 +16,24 @@ def create_disabled_message(url) -> str:
 def create_exception_message(url, exception: str) -> str:
     return f"⚠️ An exception occurred while processing {url}: {str(exception)[:100]}..."
 
+
+def create_certificate_expiry_message(host, days_left, not_after) -> str:
+    if days_left < 0:
+        return f"🟠 Certificate EXPIRED for: {host} on {not_after:%Y-%m-%d %H:%M} UTC."
+    return f"🟠 Certificate for {host} expires in {days_left} days ({not_after:%Y-%m-%d %H:%M} UTC)."
+
+def create_flapping_message(url, flap_rate) -> str:
+    return (f"🟡 Monitor is FLAPPING: {url} ({flap_rate:.0%} state changes). "
+            f"Alerts are muted until it settles.")
+
+def create_flapping_stopped_message(url, status) -> str:
+    return f"🔵 Monitor stopped flapping: {url}. Current state: {status}."
+
+def create_group_down_message(ip, urls) -> str:
+    sites = ', '.join(urls[:20])
+    if len(urls) > 20:
+        sites += f" and {len(urls) - 20} more"
+    return f"🔴 Host is DOWN: {ip}. Affected {len(urls)} sites: {sites}."
+
+def create_group_up_message(ip, urls, downtime) -> str:
+    return f"🟢 Host is UP: {ip}. {len(urls)} sites were down for {downtime}."
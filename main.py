@@ -1,4 +1,5 @@
 import os
+import random
 from datetime import datetime, timezone
 from typing import Optional
 
@@ -6,19 +7,31 @@ import asyncio
 from dotenv import load_dotenv
 
 from aiohttp_requests.request import (WebsiteChecker,
+                                      CheckResult,
                                       create_session,
                                       get_domain_from_url,
                                       resolve_domain)
 from aiohttp_requests.proxy import ProxyManager
+from aiohttp_requests.content_matcher import ContentRules, load_content_rules
+from aiohttp_requests.certificate import CertificateMonitor
 from telegram.telegram_bot import TelegramBot
 from database.aiosqlite.database_local import Database
 from database.nebilet_postgresql.database_nebilet import DBConnection
+from database.nebilet_postgresql.results_sink import PostgresResultSink
 from logs.logger import logger
 from logs.logger_message import (create_message_site_is_up,
                                  create_error_message,
                                  create_disabled_message,
-                                 create_exception_message)
+                                 create_exception_message,
+                                 create_flapping_message,
+                                 create_flapping_stopped_message,
+                                 create_group_down_message,
+                                 create_group_up_message)
 from tools.time_tools import calculate_downtime
+from tools.result_history import ResultHistory
+from tools.site_state import SiteStateMachine, SiteStatus
+from tools.failure_correlation import FailureCorrelator, GroupIncident
+from tools.result_recorder import ResultRecorder
 
 load_dotenv()
 TOKEN = os.getenv('TOKEN')
@@ -37,6 +50,7 @@ class UptimeMonitor:
                  chat_id,
                  db_connection,
                  need_saving_in_local_db=False,
+                 need_saving_in_postgres=False,
                  interval_between_checking=800,
                  time_wait_before_retrying=80,
                  delay_wait_before_start_retrying=5,
@@ -44,15 +58,49 @@ class UptimeMonitor:
                  pool_size=100,
                  limit_per_host=4,
                  limit_request_ip=1,
-                 proxy_check_interval=5):
+                 proxy_check_interval=5,
+                 content_rules: Optional[dict[str, ContentRules]] = None,
+                 certificate_refresh_interval=12,
+                 certificate_thresholds=(30, 7, 1),
+                 ssl_context=True,
+                 history_size=100,
+                 failures_to_down=1,
+                 failure_window=1,
+                 successes_to_up=1,
+                 flap_window=10,
+                 flap_start_rate=0.5,
+                 flap_stop_rate=0.25,
+                 flapping_failures_to_down=3,
+                 flapping_check_every=4,
+                 min_group_size=3,
+                 canary_count=2,
+                 group_sample_size=2,
+                 record_results_file=None):
         self.token = token
         self.chat_id = chat_id
         self.db = Database()
         self.need_saving_in_local_db = need_saving_in_local_db
         self.proxy_manager = ProxyManager(check_interval=proxy_check_interval)
         self.telegram_bot = TelegramBot(token=self.token, channel_id=self.chat_id)
+        self.certificate_monitor = CertificateMonitor(self.telegram_bot,
+                                                      refresh_interval=certificate_refresh_interval,
+                                                      thresholds=certificate_thresholds)
         self.db_connection = db_connection
+        self.results_sink = (PostgresResultSink(db_connection, logger)
+                             if need_saving_in_postgres else None)
+        self.recorder = ResultRecorder(record_results_file) if record_results_file else None
         self.urls = []
+        self.content_rules = content_rules or {}
+        self.ssl_context = ssl_context
+        self.history = ResultHistory(size=history_size)
+        self.site_states = SiteStateMachine(self.history,
+                                            failures_to_down=failures_to_down,
+                                            failure_window=failure_window,
+                                            successes_to_up=successes_to_up,
+                                            flap_window=flap_window,
+                                            flap_start_rate=flap_start_rate,
+                                            flap_stop_rate=flap_stop_rate,
+                                            flapping_failures_to_down=flapping_failures_to_down)
 
         self.INTERVAL_BETWEEN_CHECKING = interval_between_checking
         self.TIME_WAIT_BEFORE_RETRYING = time_wait_before_retrying
@@ -61,47 +109,111 @@ class UptimeMonitor:
         self.POOL_SIZE = pool_size
         self.LIMIT_PER_HOST = limit_per_host
         self.LIMIT_REQUEST_IP = limit_request_ip
+        self.FLAPPING_CHECK_EVERY = flapping_check_every
+        self.correlator = FailureCorrelator(min_group_size=min_group_size,
+                                            canary_count=canary_count,
+                                            sample_size=group_sample_size,
+                                            failures_to_down=failures_to_down,
+                                            failure_window=failure_window)
+        self.cycle = 0
         self.down_since = {}
         self.ip_semaphores = {}
+        self.site_ips = {}
+        self.group_down_since = {}
 
     async def log_status_in_sqlite(self, url, status, response_time, checked_at) -> None:
         if self.need_saving_in_local_db:
             await self.db.log_status(url, status, response_time, checked_at)
 
-    async def process_website_check(self, url, session) -> None:
+    def log_status_in_history(self, url, status, response_time, checked_at, timings) -> None:
+        timestamp = datetime.fromisoformat(checked_at).timestamp()
+        self.history.record(url, timestamp, status, response_time, timings)
+
+    def now(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+    async def run_check(self, url, session, kind='cycle') -> CheckResult:
         semaphore = await self.get_semaphore(url)
         async with semaphore:
-            try:
-                checker = WebsiteChecker(
-                    url,
-                    self.proxy_manager,
-                    self.RETRIES_IN_REPEATING_REQUESTS,
-                    self.DELAY_WAIT_BEFORE_START_RETRYING,
-                    session
-                )
-                url, status, response_time, checked_at, error = await checker.check_website()
-                if status != 200:
-                    if url not in self.down_since:
-                        error_message = create_error_message(url, status, error)
-                        await self.telegram_bot.add_to_queue(error_message)
-                        self.down_since.setdefault(url, datetime.now(timezone.utc))
-                        asyncio.create_task(self.check_site_until_up(url))
+            checker = WebsiteChecker(
+                url,
+                self.proxy_manager,
+                self.RETRIES_IN_REPEATING_REQUESTS,
+                self.DELAY_WAIT_BEFORE_START_RETRYING,
+                session,
+                content_rules=self.content_rules.get(url),
+                certificate_monitor=self.certificate_monitor,
+                ssl_context=self.ssl_context
+            )
+            result = await checker.check_website()
+            await self.log_result(result, checker.timings, kind)
+            return result
 
-                await self.log_status_in_sqlite(url, status, response_time, checked_at)
-                logger.info(f"{url} {status} {response_time} {error if error else ''}")
+    async def process_website_check(self, url, session) -> None:
+        try:
+            result = await self.run_check(url, session)
+            await self.handle_check_result(result)
+        except Exception as e:
+            await self._send_debug_exception_message(url, e)
 
-            except Exception as e:
-                await self._send_debug_exception_message(url, e)
+    async def log_result(self, result: CheckResult, timings: dict, kind='cycle') -> None:
+        url, status, response_time, checked_at, error = result
+        await self.log_status_in_sqlite(url, status, response_time, checked_at)
+        self.log_status_in_history(url, status, response_time, checked_at, timings)
+        if self.results_sink:
+            self.results_sink.add(result)
+        if self.recorder:
+            self.recorder.record(result, kind)
+        logger.info(f"{url} {status} {response_time} {error if error else ''}")
+
+    async def handle_check_result(self, result: CheckResult, recovery=False) -> None:
+        '''Прогоняет результат через автомат состояний сайта и отправляет алерты на переходах'''
+        url, status, response_time, checked_at, error = result
+        previous = self.site_states.status(url)
+        transition = self.site_states.record(url, status == 200)
+        downtime = calculate_downtime(self.down_since, url, self.now())
+
+        if transition == SiteStatus.FLAPPING:
+            flap_rate = self.site_states.flap_rate(url)
+            await self.telegram_bot.add_to_queue(create_flapping_message(url, flap_rate))
+            self.down_since.setdefault(url, self.now())
+            logger.warning(f"{url} is flapping, flap rate {flap_rate:.2f}")
+        elif previous == SiteStatus.FLAPPING and transition:
+            await self.telegram_bot.add_to_queue(create_flapping_stopped_message(url, transition.value))
+            logger.info(f"{url} stopped flapping, now {transition.value}")
+            if transition == SiteStatus.UP:
+                self.down_since.pop(url, None)
+            elif not recovery:
+                self.start_recovery(url)
+        elif transition == SiteStatus.DOWN:
+            await self.telegram_bot.add_to_queue(create_error_message(url, status, error))
+            self.down_since.setdefault(url, self.now())
+            if not recovery:
+                self.start_recovery(url)
+        elif transition == SiteStatus.UP:
+            await self.telegram_bot.add_to_queue(create_message_site_is_up(url, downtime))
+            logger.info(f"{url} is back up. Downtime: {downtime}")
+            self.down_since.pop(url, None)
+        elif recovery and status != 200:
+            error_message = create_error_message(url, status, error, downtime)
+            await self.telegram_bot.add_to_queue(error_message)
+            logger.error(f"{url} {status} {response_time} {error if error else ''}")
+
+    def start_recovery(self, url) -> None:
+        asyncio.create_task(self.check_site_until_up(url))
 
     async def check_site_until_up(self, url):
+        '''Перепроверяет упавший сайт, пока автомат не переведёт его из DOWN'''
         await asyncio.sleep(self.DELAY_WAIT_BEFORE_START_RETRYING)
 
-        while True:
+        while self.site_states.status(url) == SiteStatus.DOWN:
             try:
                 if not await self.db_connection.domain_in_production(url):
                     disabled_message = create_disabled_message(url)
                     await self.telegram_bot.add_to_queue(disabled_message)
                     logger.info(disabled_message)
+                    self.site_states.reset(url)
+                    self.down_since.pop(url, None)
                     return
 
                 checker = WebsiteChecker(
@@ -109,22 +221,16 @@ class UptimeMonitor:
                     self.proxy_manager,
                     self.RETRIES_IN_REPEATING_REQUESTS,
                     self.DELAY_WAIT_BEFORE_START_RETRYING,
-                    session=None
+                    session=None,
+                    content_rules=self.content_rules.get(url),
+                    certificate_monitor=self.certificate_monitor,
+                    ssl_context=self.ssl_context
                 )
-                url, status, response_time, checked_at, error = await checker.check_website()
-                downtime = calculate_downtime(self.down_since, url)
-                await self.log_status_in_sqlite(url, status, response_time, checked_at)
-
-                if status == 200:
-                    success_message = create_message_site_is_up(url, downtime)
-                    await self.telegram_bot.add_to_queue(success_message)
-                    logger.info(f"{url} is back up. Downtime: {downtime}")
-                    del self.down_since[url]
+                result = await checker.check_website()
+                await self.log_result(result, checker.timings, kind='recovery')
+                await self.handle_check_result(result, recovery=True)
+                if self.site_states.status(url) != SiteStatus.DOWN:
                     return
-                else:
-                    error_message = create_error_message(url, status, error, downtime)
-                    await self.telegram_bot.add_to_queue(error_message)
-                    logger.error(f"{url} {status} {response_time} {error if error else ''}")
 
             except Exception as e:
                 await self._send_debug_exception_message(url, e)
@@ -138,12 +244,90 @@ class UptimeMonitor:
 
     async def get_semaphore(self, url) -> Optional[asyncio.Semaphore]:
         '''Oграничивает одновременные запросы к 1 ip адресу'''
-        domain = get_domain_from_url(url)
-        ip = await resolve_domain(domain)
+        ip = self.site_ips.get(url) or await self.resolve_site_ip(url)
         if ip not in self.ip_semaphores:
             self.ip_semaphores[ip] = asyncio.Semaphore(self.LIMIT_REQUEST_IP)
         return self.ip_semaphores[ip]
 
+    async def resolve_site_ip(self, url) -> str:
+        domain = get_domain_from_url(url)
+        self.site_ips[url] = await resolve_domain(domain)
+        return self.site_ips[url]
+
+    async def probe_sites(self, urls, session) -> list[CheckResult]:
+        results = await asyncio.gather(*(self.run_check(url, session, kind='probe') for url in urls),
+                                       return_exceptions=True)
+        for url, result in zip(urls, results):
+            if isinstance(result, Exception):
+                await self._send_debug_exception_message(url, result)
+        return [result for result in results if isinstance(result, CheckResult)]
+
+    async def check_group(self, ip, urls, session) -> None:
+        '''Сначала проверяет контрольные сайты группы, при их падении - выборку остальных.
+        Если упали все, остальные сайты в этом цикле не проверяются, а после failures_to_down
+        таких циклов открывается один инцидент на группу вместо алертов по каждому сайту'''
+        if not self.correlator.is_correlated(urls):
+            await asyncio.gather(*(self.process_website_check(url, session) for url in urls))
+            return
+
+        canaries, rest = self.correlator.split(urls, self.correlator.canary_count)
+        probes = await self.probe_sites(canaries, session)
+        if all(self.correlator.is_host_failure(result) for result in probes):
+            sample, rest = self.correlator.split(rest, self.correlator.sample_size)
+            probes += await self.probe_sites(sample, session)
+            if probes and all(self.correlator.is_host_failure(result) for result in probes):
+                if self.correlator.record_group(ip, failed=True):
+                    await self.open_group_incident(ip, urls)
+                else:
+                    logger.warning(f"Host {ip} failed canary checks, skipping {len(rest)} sites this cycle")
+                return
+
+        self.correlator.record_group(ip, failed=False)
+        for result in probes:
+            await self.handle_check_result(result)
+        await asyncio.gather(*(self.process_website_check(url, session) for url in rest))
+
+    async def open_group_incident(self, ip, urls) -> None:
+        incident = self.correlator.open_incident(ip, urls)
+        self.group_down_since[ip] = self.now()
+        message = create_group_down_message(ip, urls)
+        await self.telegram_bot.add_to_queue(message)
+        logger.error(message)
+        asyncio.create_task(self.check_group_until_up(incident))
+
+    async def check_group_until_up(self, incident: GroupIncident) -> None:
+        '''Пока хост лежит, проверяет по одному сайту группы вместо всех'''
+        await asyncio.sleep(self.DELAY_WAIT_BEFORE_START_RETRYING)
+
+        while True:
+            canary = None
+            try:
+                for url in list(incident.sites):
+                    if not await self.db_connection.domain_in_production(url):
+                        disabled_message = create_disabled_message(url)
+                        await self.telegram_bot.add_to_queue(disabled_message)
+                        logger.info(disabled_message)
+                        self.correlator.remove_site(incident.key, url)
+                if not incident.sites:
+                    self.correlator.close_incident(incident.key)
+                    del self.group_down_since[incident.key]
+                    return
+
+                canary = random.choice(incident.sites)
+                result = await self.run_check(canary, session=None, kind='group_recovery')
+                if not self.correlator.is_host_failure(result):
+                    downtime = calculate_downtime(self.group_down_since, incident.key, self.now())
+                    message = create_group_up_message(incident.key, incident.sites, downtime)
+                    await self.telegram_bot.add_to_queue(message)
+                    logger.info(message)
+                    self.correlator.close_incident(incident.key)
+                    del self.group_down_since[incident.key]
+                    return
+            except Exception as e:
+                await self._send_debug_exception_message(canary or incident.key, e)
+
+            await asyncio.sleep(self.TIME_WAIT_BEFORE_RETRYING)
+
     async def uptime_check_cycle(self) -> None:
         while True:
             self.urls = await self.db_connection.get_sites()
@@ -152,16 +336,37 @@ class UptimeMonitor:
                 await self.send_request_to_all_urls(session)
             await asyncio.sleep(self.INTERVAL_BETWEEN_CHECKING)
 
+    def need_check_in_cycle(self, url) -> bool:
+        '''Упавшие сайты проверяет check_site_until_up, сайты упавшего хоста - check_group_until_up,
+        мигающие - раз в FLAPPING_CHECK_EVERY циклов, но каждый цикл, пока последняя проверка неудачна'''
+        state = self.site_states.get(url)
+        if state.status == SiteStatus.DOWN or self.correlator.in_incident(url):
+            return False
+        if state.status == SiteStatus.FLAPPING and not state.consecutive_failures:
+            return self.cycle % self.FLAPPING_CHECK_EVERY == 0
+        return True
+
     async def send_request_to_all_urls(self, session) -> None:
-        tasks = [self.process_website_check(url, session) for url in self.urls]
+        self.cycle += 1
+        urls = [url for url in self.urls if self.need_check_in_cycle(url)]
+        ips = await asyncio.gather(*(self.resolve_site_ip(url) for url in urls))
+        groups = self.correlator.group(dict(zip(urls, ips)))
+        tasks = [self.check_group(ip, group_urls, session) for ip, group_urls in groups.items()]
         await asyncio.gather(*tasks, return_exceptions=True)
 
     async def main(self) -> None:
         if self.need_saving_in_local_db:
             await self.db.init_db()
         await self.proxy_manager.initialize()
+        sink_task = asyncio.create_task(self.results_sink.run()) if self.results_sink else None
         asyncio.create_task(self.uptime_check_cycle())
-        await self.telegram_bot.start_polling()
+        try:
+            await self.telegram_bot.start_polling()
+        finally:
+            if sink_task:
+                # run() завершается последним flush буфера
+                sink_task.cancel()
+                await asyncio.gather(sink_task, return_exceptions=True)
 
 
 if __name__ == '__main__':
@@ -179,12 +384,15 @@ if __name__ == '__main__':
         chat_id=CHAT_ID,
         db_connection=db_connection,
         need_saving_in_local_db=False,
+        need_saving_in_postgres=False,
         interval_between_checking=800,
         time_wait_before_retrying=80,
         delay_wait_before_start_retrying=35,
         retries_in_repeated_requests=3,
         pool_size=10,
         limit_per_host=1,
-        limit_request_ip=1
+        limit_request_ip=1,
+        record_results_file=None,
+        content_rules=load_content_rules()
     )
     asyncio.run(monitor.main())
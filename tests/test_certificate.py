@@ -0,0 +1,169 @@
+import logging
+import shutil
+import ssl
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+import asyncio
+import pytest
+from aiohttp import web
+
+from aiohttp_requests.certificate import CertificateMonitor
+from aiohttp_requests.proxy import ProxyManager
+from aiohttp_requests.request import WebsiteChecker, create_session
+
+
+class QueueBot:
+    def __init__(self):
+        self.messages = []
+
+    async def add_to_queue(self, message):
+        self.messages.append(message)
+
+
+@pytest.fixture
+def self_signed_cert(tmp_path):
+    if not shutil.which('openssl'):
+        pytest.skip('openssl is not available')
+    cert, key = tmp_path / 'cert.pem', tmp_path / 'key.pem'
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+                    '-keyout', str(key), '-out', str(cert), '-days', '20',
+                    '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1'],
+                   check=True, capture_output=True)
+    return str(cert), str(key)
+
+
+async def check_local_tls_server(cert, key, ssl_context, monitor):
+    server_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_context.load_cert_chain(cert, key)
+    app = web.Application()
+
+    async def index(request):
+        return web.Response(text='ok')
+
+    app.router.add_get('/', index)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0, ssl_context=server_context)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        async with await create_session(need_connector=False) as session:
+            checker = WebsiteChecker(f'https://127.0.0.1:{port}/',
+                                     ProxyManager(),
+                                     retries_in_repeated_requests=1,
+                                     session=session,
+                                     certificate_monitor=monitor,
+                                     ssl_context=ssl_context)
+            return await checker.check_website()
+    finally:
+        await runner.cleanup()
+
+
+@pytest.mark.parametrize('verify', [True, False])
+def test_monitor_reads_certificate_from_check_connection(self_signed_cert, verify):
+    cert, key = self_signed_cert
+    ssl_context = ssl.create_default_context(cafile=cert) if verify else False
+    bot = QueueBot()
+    monitor = CertificateMonitor(bot, thresholds=(30, 7, 1))
+
+    result = asyncio.run(check_local_tls_server(cert, key, ssl_context, monitor))
+
+    assert result.status == 200
+    [info] = monitor.certificates.values()
+    assert info.ip == '127.0.0.1'
+    assert 18 <= info.days_left(datetime.now(timezone.utc)) <= 20
+    assert len(bot.messages) == 1
+    assert 'expires in' in bot.messages[0]
+
+
+def test_cached_certificate_is_not_reread(self_signed_cert):
+    cert, key = self_signed_cert
+    monitor = CertificateMonitor(QueueBot())
+    asyncio.run(check_local_tls_server(cert, key, False, monitor))
+    [info] = monitor.certificates.values()
+    assert not monitor.needs_refresh(info.host, info.ip, datetime.now(timezone.utc))
+    assert monitor.needs_refresh(info.host, info.ip,
+                                 datetime.now(timezone.utc) + timedelta(hours=13))
+
+
+def test_one_alert_per_threshold():
+    bot = QueueBot()
+    monitor = CertificateMonitor(bot, thresholds=(30, 7, 1))
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    not_after = now + timedelta(days=20, hours=1)
+
+    async def run():
+        await monitor.update('example.com', '10.0.0.1', not_after, now)
+        await monitor.update('example.com', '10.0.0.1', not_after, now + timedelta(days=1))
+        await monitor.update('example.com', '10.0.0.1', not_after, now + timedelta(days=14))
+        await monitor.update('example.com', '10.0.0.1', not_after, now + timedelta(days=20))
+
+    asyncio.run(run())
+    assert [message.split(' expires in ')[1].split()[0] for message in bot.messages] == ['20', '6', '0']
+
+
+def test_host_behind_several_ips_alerts_once():
+    bot = QueueBot()
+    monitor = CertificateMonitor(bot)
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    not_after = now + timedelta(days=20)
+
+    async def run():
+        await monitor.update('example.com', '10.0.0.1', not_after, now)
+        await monitor.update('example.com', '10.0.0.2', not_after, now)
+
+    asyncio.run(run())
+    assert len(monitor.certificates) == 2
+    assert len(bot.messages) == 1
+
+
+def test_renewed_certificate_alerts_again():
+    bot = QueueBot()
+    monitor = CertificateMonitor(bot)
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    async def run():
+        await monitor.update('example.com', '10.0.0.1', now + timedelta(days=5), now)
+        await monitor.update('example.com', '10.0.0.1', now + timedelta(days=25), now)
+
+    asyncio.run(run())
+    assert len(bot.messages) == 2
+
+
+def test_response_exposes_connection_transport():
+    '''Проверка сертификатов держится на приватном response._protocol aiohttp'''
+    async def run():
+        app = web.Application()
+
+        async def index(request):
+            return web.Response(text='ok')
+
+        app.router.add_get('/', index)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            async with await create_session(need_connector=False) as session:
+                async with session.get(f'http://127.0.0.1:{port}/') as response:
+                    await response.read()
+                    return WebsiteChecker._get_transport(response)
+        finally:
+            await runner.cleanup()
+
+    transport = asyncio.run(run())
+    assert transport is not None
+    assert transport.get_extra_info('peername')[0] == '127.0.0.1'
+
+
+def test_missing_transport_is_logged_once(caplog, monkeypatch):
+    class Response:
+        url = 'https://example.com/'
+
+    monkeypatch.setattr(WebsiteChecker, 'transport_missing_logged', False)
+    with caplog.at_level(logging.WARNING, logger='uptime_monitor'):
+        assert WebsiteChecker._get_transport(Response()) is None
+        assert WebsiteChecker._get_transport(Response()) is None
+    assert len([r for r in caplog.records if 'No transport' in r.getMessage()]) == 1
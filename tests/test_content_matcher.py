@@ -0,0 +1,81 @@
+from aiohttp_requests.content_matcher import AhoCorasick, ContentRules
+
+
+def feed_all(rules, chunks, encoding=None):
+    scanner = rules.scanner(encoding)
+    for chunk in chunks:
+        scanner.feed(chunk)
+        if scanner.decided:
+            break
+    return scanner
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    matcher = AhoCorasick(['he', 'she', 'his', 'hers'])
+    _, found = matcher.feed(0, 'ushers')
+    assert found == {0, 1, 3}
+
+
+def test_aho_corasick_keeps_state_across_chunks():
+    matcher = AhoCorasick(['maintenance'])
+    state, found = matcher.feed(0, 'site under mainte')
+    assert not found
+    _, found = matcher.feed(state, 'nance')
+    assert found == {0}
+
+
+def test_keyword_split_between_chunks():
+    scanner = feed_all(ContentRules(must_contain=['Welcome']), [b'<h1>Wel', b'come</h1>'])
+    assert scanner.decided
+    assert scanner.result() is None
+
+
+def test_stops_reading_once_required_found():
+    scanner = feed_all(ContentRules(must_contain=['ok']), [b'ok', b'x' * 100])
+    assert scanner.bytes_read == 2
+
+
+def test_forbidden_keyword_fails_immediately():
+    rules = ContentRules(must_contain=['ok'], must_not_contain=['Maintenance'])
+    scanner = feed_all(rules, [b'ok main', b'tenance', b'never read'])
+    assert scanner.bytes_read == 14
+    assert 'Maintenance' in scanner.result()
+
+
+def test_regex_across_chunk_boundary():
+    scanner = feed_all(ContentRules(must_match=[r'price:\s*\d+']), [b'price', b':  42'])
+    assert scanner.result() is None
+
+
+def test_byte_cap():
+    scanner = feed_all(ContentRules(must_contain=['x'], max_bytes=5), [b'aaaaaaaax'])
+    assert scanner.decided
+    assert scanner.bytes_read == 5
+    assert scanner.result() is not None
+
+
+def test_cyrillic_case_insensitive():
+    assert feed_all(ContentRules(must_contain=['Привет']), ['привет'.encode()]).result() is None
+    assert feed_all(ContentRules(must_contain=['привет']), ['ПРИВЕТ'.encode()]).result() is None
+
+
+def test_case_sensitive():
+    assert feed_all(ContentRules(must_contain=['Привет'], case_sensitive=True),
+                    ['привет'.encode()]).result() is not None
+
+
+def test_multibyte_char_split_between_chunks():
+    data = 'Привет'.encode()
+    scanner = feed_all(ContentRules(must_contain=['привет']), [data[:3], data[3:]])
+    assert scanner.result() is None
+
+
+def test_windows_1251_body():
+    body = 'Сайт на обслуживании'.encode('cp1251')
+    rules = ContentRules(must_not_contain=['обслуживании'])
+    assert feed_all(rules, [body], encoding='windows-1251').result() is not None
+
+
+def test_unknown_charset_falls_back_to_utf8():
+    scanner = feed_all(ContentRules(must_contain=['ok']), [b'ok'], encoding='no-such-charset')
+    assert scanner.result() is None
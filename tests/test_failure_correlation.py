@@ -0,0 +1,30 @@
+from tools.failure_correlation import FailureCorrelator
+
+
+def test_group_incident_needs_k_of_n_failed_cycles():
+    correlator = FailureCorrelator(failures_to_down=2, failure_window=3)
+    assert not correlator.record_group('10.0.0.1', failed=True)
+    assert not correlator.record_group('10.0.0.1', failed=False)
+    assert correlator.record_group('10.0.0.1', failed=True)
+
+
+def test_single_failed_cycle_opens_incident_by_default():
+    assert FailureCorrelator().record_group('10.0.0.1', failed=True)
+
+
+def test_opened_incident_resets_group_history():
+    correlator = FailureCorrelator(failures_to_down=2, failure_window=2)
+    correlator.record_group('10.0.0.1', failed=True)
+    correlator.record_group('10.0.0.1', failed=True)
+    correlator.open_incident('10.0.0.1', ['a', 'b', 'c'])
+    correlator.close_incident('10.0.0.1')
+    assert not correlator.record_group('10.0.0.1', failed=True)
+
+
+def test_disabled_site_leaves_incident():
+    correlator = FailureCorrelator()
+    correlator.open_incident('10.0.0.1', ['a', 'b', 'c'])
+    correlator.remove_site('10.0.0.1', 'b')
+    assert correlator.incidents['10.0.0.1'].sites == ['a', 'c']
+    assert not correlator.in_incident('b')
+    assert correlator.in_incident('a')
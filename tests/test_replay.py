@@ -0,0 +1,52 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import asyncio
+
+from tools.replay import replay
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def write_recording(path, rows):
+    with open(path, 'w') as f:
+        for minute, status, kind in rows:
+            f.write(json.dumps({'url': 'https://example.com',
+                                'status': status,
+                                'response_time': 0.1,
+                                'checked_at': (START + timedelta(minutes=minute)).isoformat(),
+                                'error': None,
+                                'kind': kind}) + '\n')
+    return path
+
+
+def test_recorded_recovery_checks_follow_replayed_state(tmp_path):
+    path = write_recording(tmp_path / 'recording.jsonl', [(0, 200, 'cycle'),
+                                                          (1, 503, 'cycle'),
+                                                          (2, 503, 'recovery'),
+                                                          (3, 503, 'recovery'),
+                                                          (4, 200, 'recovery')])
+    report = asyncio.run(replay(path, failures_to_down=4, failure_window=4))
+    assert report.results == 5
+    assert report.alerts == []
+    assert not report.time_to_detect
+
+
+def test_replay_with_recorded_thresholds(tmp_path):
+    path = write_recording(tmp_path / 'recording.jsonl', [(0, 200, 'cycle'),
+                                                          (1, 503, 'cycle'),
+                                                          (2, 503, 'recovery'),
+                                                          (3, 200, 'recovery')])
+    report = asyncio.run(replay(path))
+    assert report.alert_counts == {'DOWN': 1, 'REMINDER': 1, 'UP': 1}
+    assert report.time_to_detect == [0.0]
+
+
+def test_stricter_threshold_delays_detection(tmp_path):
+    path = write_recording(tmp_path / 'recording.jsonl', [(0, 200, 'cycle'),
+                                                          (1, 503, 'cycle'),
+                                                          (2, 503, 'cycle'),
+                                                          (3, 200, 'recovery')])
+    report = asyncio.run(replay(path, failures_to_down=2, failure_window=2))
+    assert report.alert_counts == {'DOWN': 1, 'UP': 1}
+    assert report.time_to_detect == [60.0]
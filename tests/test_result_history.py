@@ -0,0 +1,41 @@
+import math
+
+from tools.result_history import ResultHistory
+
+
+def test_ring_buffer_keeps_last_checks_in_order():
+    history = ResultHistory(size=4, initial_sites=1)
+    for i in range(6):
+        history.record('https://a', 100 + i, 200, i)
+    [timestamps] = history._recent(history.slots['https://a'], None, None, history.timestamps)
+    assert list(timestamps) == [102, 103, 104, 105]
+
+
+def test_grows_from_zero_capacity():
+    history = ResultHistory(size=4, initial_sites=0)
+    history.record('https://a', 100, 200, 0.1)
+    history.record('https://b', 100, 200, 0.1)
+    assert history.capacity == 2
+    assert history.uptime() == {'https://a': 1.0, 'https://b': 1.0}
+
+
+def test_metrics_over_window():
+    history = ResultHistory(size=10)
+    for i in range(6):
+        history.record('https://a', 100 + i, 200 if i % 2 else 500, i * 0.1, {'dns': 0.01})
+        history.record('https://b', 100 + i, 200, 0.5)
+
+    assert history.uptime() == {'https://a': 0.5, 'https://b': 1.0}
+    assert history.uptime(window=2, now=105)['https://a'] == 2 / 3
+    assert history.flap_rate() == {'https://a': 1.0, 'https://b': 0.0}
+    assert math.isclose(history.percentile(50)['https://a'], 0.3)
+    assert history.phase_percentile('dns', 95)['https://a'] == 0.01
+    assert math.isnan(history.phase_percentile('dns', 95)['https://b'])
+
+
+def test_non_numeric_status_counts_as_failure():
+    history = ResultHistory(size=4)
+    history.record('https://a', 100, 'Exception', 0)
+    history.record('https://a', 101, 200, 0.2)
+    assert history.uptime() == {'https://a': 0.5}
+    assert history.percentile(95) == {'https://a': 0.2}
@@ -0,0 +1,162 @@
+import logging
+import os
+from contextlib import asynccontextmanager
+
+import asyncio
+import asyncpg
+
+from aiohttp_requests.request import CheckResult
+from database.nebilet_postgresql.results_sink import PostgresResultSink
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+
+    async def execute(self, query):
+        if self.db.fail_ddl:
+            raise OSError('connection lost')
+        self.db.ddl.append(query)
+
+    async def copy_records_to_table(self, table, records, columns):
+        if self.db.fail_copy:
+            raise self.db.copy_error
+        self.db.rows.extend(records)
+
+
+class FakeDB:
+    def __init__(self):
+        self.ddl, self.rows = [], []
+        self.fail_ddl = self.fail_copy = False
+        self.copy_error = OSError('connection lost')
+
+    @asynccontextmanager
+    async def get_cursor(self):
+        yield FakeConnection(self)
+
+
+def make_sink(tmp_path, db, **kwargs):
+    sink = PostgresResultSink(db, logging.getLogger('test'), instance='test', **kwargs)
+    sink.spill_file = str(tmp_path / 'spill.jsonl')
+    sink.rejected_file = str(tmp_path / 'rejected.jsonl')
+    return sink
+
+
+def result(minute, month=1):
+    return CheckResult('https://example.com', 200, 0.1,
+                       f'2026-{month:02d}-01T00:{minute:02d}:00+00:00', None)
+
+
+def test_failed_ddl_does_not_mark_partitions_created(tmp_path):
+    db = FakeDB()
+    db.fail_ddl = True
+    sink = make_sink(tmp_path, db)
+    sink.add(result(0))
+    asyncio.run(sink.flush())
+    assert not sink.table_created
+    assert not sink.partitions
+
+    db.fail_ddl = False
+    asyncio.run(sink.flush())
+    assert sink.partitions == {'uptime_check_results_2026_01'}
+    assert len(db.rows) == 1
+
+
+def test_partitions_created_once(tmp_path):
+    db = FakeDB()
+    sink = make_sink(tmp_path, db)
+    for minute in range(3):
+        sink.add(result(minute))
+    asyncio.run(sink.flush())
+    sink.add(result(5))
+    asyncio.run(sink.flush())
+    assert len(db.ddl) == 2
+    assert len(db.rows) == 4
+
+
+def test_spill_keeps_only_unsent_batches(tmp_path):
+    db = FakeDB()
+    sink = make_sink(tmp_path, db, batch_size=2)
+    for minute in range(5):
+        sink.add(result(minute))
+    sink._spill(sink.buffer)
+    sink.buffer = []
+    sent = []
+
+    async def copy(records):
+        if sent:
+            raise OSError('connection lost')
+        sent.extend(records)
+
+    sink._copy = copy
+    asyncio.run(sink.flush())
+    with open(sink.spill_file) as f:
+        assert len(f.readlines()) == 3
+
+    sink._copy = PostgresResultSink._copy.__get__(sink)
+    asyncio.run(sink.flush())
+    assert len(db.rows) == 3
+
+
+def test_run_flushes_buffer_on_cancel(tmp_path):
+    db = FakeDB()
+    sink = make_sink(tmp_path, db, flush_interval=3600)
+
+    async def run():
+        task = asyncio.create_task(sink.run())
+        await asyncio.sleep(0)
+        sink.add(result(0))
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert len(db.rows) == 1
+
+
+def read_lines(path):
+    with open(path) as f:
+        return f.readlines()
+
+
+def test_truncated_spill_line_is_moved_aside(tmp_path):
+    db = FakeDB()
+    sink = make_sink(tmp_path, db)
+    sink.add(result(0))
+    sink._spill(sink.buffer)
+    with open(sink.spill_file, 'a') as f:
+        f.write('{"instance": "test", "url": "https://exa')
+    sink.buffer = []
+    sink.add(result(1))
+    sink._spill(sink.buffer)
+    sink.buffer = []
+
+    asyncio.run(sink.flush())
+    assert len(db.rows) == 2
+    assert not os.path.exists(sink.spill_file)
+    assert len(read_lines(sink.rejected_file)) == 1
+
+
+def test_rejected_batch_is_not_retried(tmp_path):
+    db = FakeDB()
+    db.fail_copy = True
+    db.copy_error = asyncpg.DataError('invalid input syntax')
+    sink = make_sink(tmp_path, db)
+    sink.add(result(0))
+    sink.add(result(1))
+    asyncio.run(sink.flush())
+    assert not os.path.exists(sink.spill_file)
+    assert len(read_lines(sink.rejected_file)) == 2
+
+    db.fail_copy = False
+    asyncio.run(sink.flush())
+    assert db.rows == []
+
+
+def test_spill_file_is_capped(tmp_path):
+    db = FakeDB()
+    db.fail_copy = True
+    sink = make_sink(tmp_path, db, max_spill_bytes=200)
+    for _ in range(5):
+        sink.add(result(0))
+        asyncio.run(sink.flush())
+    assert os.path.getsize(sink.spill_file) < 400
@@ -0,0 +1,69 @@
+import pytest
+
+from tools.result_history import ResultHistory
+from tools.site_state import SiteStateMachine, SiteStatus
+
+
+def make_machine(**kwargs):
+    history = ResultHistory(size=20)
+    machine = SiteStateMachine(history, **kwargs)
+    clock = iter(range(10 ** 6))
+
+    def record(ok):
+        history.record('https://a', next(clock), 200 if ok else 500, 0.1)
+        return machine.record('https://a', ok)
+
+    return machine, record
+
+
+def test_k_of_n_failures_and_m_successes():
+    machine, record = make_machine(failures_to_down=2, failure_window=3,
+                                   successes_to_up=2, flap_window=0)
+    assert [record(ok) for ok in [False, True, False]] == [None, None, SiteStatus.DOWN]
+    assert [record(ok) for ok in [True, False, True, True]] == [None, None, None, SiteStatus.UP]
+
+
+def test_bouncing_site_alerts_once_as_flapping():
+    machine, record = make_machine(flap_window=6, flap_start_rate=0.5, flap_stop_rate=0.2)
+    transitions = [record(ok) for ok in [True, False, True, False, True, False, True, False]]
+    assert transitions[:3] == [None, SiteStatus.DOWN, SiteStatus.UP]
+    assert transitions[3] == SiteStatus.FLAPPING
+    assert all(transition is None for transition in transitions[4:])
+    stable = [record(True) for _ in range(7)]
+    assert stable[-1] is None and SiteStatus.UP in stable
+    assert machine.status('https://a') == SiteStatus.UP
+
+
+def test_flapping_site_that_goes_hard_down_escalates():
+    machine, record = make_machine(flap_window=6, flapping_failures_to_down=3)
+    for ok in [True, False, True, False, True]:
+        record(ok)
+    assert machine.status('https://a') == SiteStatus.FLAPPING
+    assert [record(False) for _ in range(3)] == [None, None, SiteStatus.DOWN]
+    assert [record(False) for _ in range(5)] == [None] * 5
+
+
+def test_flap_rate_reads_result_history():
+    machine, record = make_machine(flap_window=4)
+    for ok in [True, False, True]:
+        record(ok)
+    assert machine.flap_rate('https://a') == 0.5
+
+
+def test_flap_window_must_fit_history():
+    with pytest.raises(ValueError):
+        SiteStateMachine(ResultHistory(size=10), flap_window=10)
+
+
+def test_escalated_site_does_not_return_to_flapping():
+    machine, record = make_machine(flap_window=10, flap_stop_rate=0.25, flapping_failures_to_down=3)
+    for ok in [True, False] * 3 + [True]:
+        record(ok)
+    assert machine.status('https://a') == SiteStatus.FLAPPING
+    transitions = [record(ok) for ok in [False, False, False, True] * 10]
+    assert [t for t in transitions if t] == [SiteStatus.DOWN]
+    assert machine.status('https://a') == SiteStatus.DOWN
+
+    recovered = [record(True) for _ in range(10)]
+    assert [t for t in recovered if t] == [SiteStatus.UP]
+    assert record(False) == SiteStatus.DOWN
@@ -0,0 +1,82 @@
+import random
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+from aiohttp_requests.request import CheckResult
+
+
+@dataclass
+class GroupIncident:
+    key: str
+    sites: list[str]
+
+
+class FailureCorrelator:
+    '''Группирует сайты по IP хостинга. Если падают контрольные сайты группы (canary)
+    и случайная выборка остальных, группа считается упавшей целиком
+    и остальные сайты не проверяются до восстановления хоста.
+    Инцидент открывается по тому же правилу K из N, что и для отдельного сайта:
+    failures_to_down упавших циклов из последних failure_window'''
+    def __init__(self, min_group_size=3, canary_count=2, sample_size=2,
+                 failures_to_down=1, failure_window=1):
+        self.min_group_size = min_group_size
+        self.canary_count = canary_count
+        self.sample_size = sample_size
+        self.failures_to_down = failures_to_down
+        self.failure_window = max(failure_window, failures_to_down)
+        self.incidents: dict[str, GroupIncident] = {}
+        self.site_incidents: dict[str, str] = {}
+        self.group_outcomes: dict[str, deque] = {}
+
+    @staticmethod
+    def is_host_failure(result: CheckResult) -> bool:
+        '''Хост не ответил или ответил ошибкой сервера; несовпадение контента сюда не относится'''
+        if isinstance(result.status, int):
+            return result.status >= 500
+        return result.status == 'Exception'
+
+    def group(self, site_ips: dict[str, str]) -> dict[str, list[str]]:
+        groups: dict[str, list[str]] = {}
+        for url, ip in site_ips.items():
+            # Нерезолвящиеся домены падают каждый по своей причине
+            key = ip if ip != 'None' else url
+            groups.setdefault(key, []).append(url)
+        return groups
+
+    def is_correlated(self, sites: list[str]) -> bool:
+        return len(sites) >= self.min_group_size
+
+    def split(self, sites: list[str], count: int) -> tuple[list[str], list[str]]:
+        chosen = random.sample(sites, min(count, len(sites)))
+        return chosen, [url for url in sites if url not in chosen]
+
+    def record_group(self, key: str, failed: bool) -> bool:
+        '''Учитывает цикл проверки группы; True, если пора открывать инцидент'''
+        outcomes = self.group_outcomes.setdefault(key, deque(maxlen=self.failure_window))
+        outcomes.append(failed)
+        return outcomes.count(True) >= self.failures_to_down
+
+    def open_incident(self, key: str, sites: list[str]) -> GroupIncident:
+        incident = GroupIncident(key, sites)
+        self.incidents[key] = incident
+        self.group_outcomes.pop(key, None)
+        for url in sites:
+            self.site_incidents[url] = key
+        return incident
+
+    def close_incident(self, key: str) -> Optional[GroupIncident]:
+        incident = self.incidents.pop(key, None)
+        if incident:
+            for url in incident.sites:
+                self.site_incidents.pop(url, None)
+        return incident
+
+    def remove_site(self, key: str, url: str) -> None:
+        incident = self.incidents.get(key)
+        if incident and url in incident.sites:
+            incident.sites.remove(url)
+            self.site_incidents.pop(url, None)
+
+    def in_incident(self, url: str) -> bool:
+        return url in self.site_incidents
@@ -0,0 +1,104 @@
+import argparse
+import statistics
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import asyncio
+
+from main import UptimeMonitor
+from tools.result_recorder import read_recording
+from tools.site_state import SiteStatus
+
+
+class ReplayMonitor(UptimeMonitor):
+    '''UptimeMonitor на виртуальных часах: время берётся из записанных результатов,
+    повторные проверки не запускаются - они уже есть в записи'''
+    def __init__(self, **kwargs):
+        super().__init__(token='0:replay', chat_id=None, db_connection=None, **kwargs)
+        self.clock = None
+
+    def now(self) -> datetime:
+        return self.clock
+
+    def start_recovery(self, url) -> None:
+        pass
+
+
+@dataclass
+class ReplayReport:
+    alerts: list[tuple[datetime, str, str]] = field(default_factory=list)
+    alert_counts: Counter = field(default_factory=Counter)
+    time_to_detect: list[float] = field(default_factory=list)
+    results: int = 0
+
+    def summary(self) -> str:
+        lines = [f"Results replayed: {self.results}",
+                 f"Alerts: {len(self.alerts)} {dict(self.alert_counts)}"]
+        if self.time_to_detect:
+            lines.append(f"Time to detect, s: mean {statistics.mean(self.time_to_detect):.0f}, "
+                         f"median {statistics.median(self.time_to_detect):.0f}, "
+                         f"max {max(self.time_to_detect):.0f}")
+        return '\n'.join(lines)
+
+
+async def replay(path, **monitor_kwargs) -> ReplayReport:
+    '''Прогоняет запись через автомат состояний и очередь TelegramBot.
+    Корреляция по хостам не моделируется: пробы групп проигрываются как обычные проверки.
+    Повторной считается проверка сайта, который лежит в проигрываемом автомате, а не в записи:
+    при других порогах записанные recovery-проверки могут прийти, пока сайт ещё UP'''
+    monitor = ReplayMonitor(**monitor_kwargs)
+    queue = monitor.telegram_bot.message_queue
+    report = ReplayReport()
+    failing_since: dict[str, datetime] = {}
+
+    for result, _ in read_recording(path):
+        monitor.clock = datetime.fromisoformat(result.checked_at)
+        report.results += 1
+        if result.status == 200:
+            failing_since.pop(result.url, None)
+        else:
+            failing_since.setdefault(result.url, monitor.clock)
+
+        monitor.log_status_in_history(result.url, result.status, result.response_time,
+                                      result.checked_at, None)
+        previous = monitor.site_states.status(result.url)
+        await monitor.handle_check_result(result, recovery=previous == SiteStatus.DOWN)
+        current = monitor.site_states.status(result.url)
+
+        while not queue.empty():
+            message = queue.get_nowait()
+            report.alerts.append((monitor.clock, result.url, message))
+            report.alert_counts[current.value if current != previous else 'REMINDER'] += 1
+
+        if previous == SiteStatus.UP and current != SiteStatus.UP and result.url in failing_since:
+            detected_in = monitor.clock - failing_since[result.url]
+            report.time_to_detect.append(detected_in.total_seconds())
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay recorded check results through alert logic')
+    parser.add_argument('recording')
+    parser.add_argument('--failures-to-down', type=int, default=1)
+    parser.add_argument('--failure-window', type=int, default=1)
+    parser.add_argument('--successes-to-up', type=int, default=1)
+    parser.add_argument('--flap-window', type=int, default=10)
+    parser.add_argument('--flap-start-rate', type=float, default=0.5)
+    parser.add_argument('--flap-stop-rate', type=float, default=0.25)
+    parser.add_argument('--flapping-failures-to-down', type=int, default=3)
+    parser.add_argument('--show-alerts', action='store_true')
+    args = parser.parse_args()
+
+    report = asyncio.run(replay(args.recording,
+                                failures_to_down=args.failures_to_down,
+                                failure_window=args.failure_window,
+                                successes_to_up=args.successes_to_up,
+                                flap_window=args.flap_window,
+                                flap_start_rate=args.flap_start_rate,
+                                flap_stop_rate=args.flap_stop_rate,
+                                flapping_failures_to_down=args.flapping_failures_to_down))
+    if args.show_alerts:
+        for at, url, message in report.alerts:
+            print(f"{at.isoformat()} {message}")
+    print(report.summary())
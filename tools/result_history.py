@@ -0,0 +1,131 @@
+import math
+import time
+from array import array
+from typing import Optional
+
+PHASES = ('dns', 'connect')
+
+
+class ResultHistory:
+    '''Кольцевой буфер последних проверок по каждому сайту.
+    Все сайты лежат в общих предвыделенных массивах: сайт занимает отрезок длины size.
+    Метрики считаются обычным циклом по сайтам над срезами этих массивов (без numpy),
+    зато без обращения к SQLite'''
+    def __init__(self, size=100, initial_sites=64):
+        self.size = size
+        self.capacity = 0
+        self.slots: dict[str, int] = {}
+        self.timestamps = array('d')
+        self.statuses = array('h')
+        self.latencies = array('d')
+        self.phases = {phase: array('d') for phase in PHASES}
+        self.counts = array('q')
+        self._grow(initial_sites)
+
+    def _grow(self, sites: int) -> None:
+        added = sites - self.capacity
+        self.timestamps.extend(array('d', [0.0]) * (added * self.size))
+        self.statuses.extend(array('h', [0]) * (added * self.size))
+        self.latencies.extend(array('d', [math.nan]) * (added * self.size))
+        for column in self.phases.values():
+            column.extend(array('d', [math.nan]) * (added * self.size))
+        self.counts.extend(array('q', [0]) * added)
+        self.capacity = sites
+
+    def _slot(self, url: str) -> int:
+        if url not in self.slots:
+            if len(self.slots) == self.capacity:
+                self._grow(max(1, self.capacity * 2))
+            self.slots[url] = len(self.slots)
+        return self.slots[url]
+
+    def record(self,
+               url: str,
+               timestamp: float,
+               status: str | int,
+               latency: float,
+               timings: Optional[dict] = None) -> None:
+        slot = self._slot(url)
+        index = slot * self.size + self.counts[slot] % self.size
+        self.timestamps[index] = timestamp
+        self.statuses[index] = status if isinstance(status, int) else 0
+        self.latencies[index] = latency
+        timings = timings or {}
+        for phase, column in self.phases.items():
+            column[index] = timings.get(phase, math.nan)
+        self.counts[slot] += 1
+
+    def _window(self, column: array, slot: int) -> array:
+        '''Значения сайта в хронологическом порядке'''
+        start = slot * self.size
+        count = self.counts[slot]
+        if count < self.size:
+            return column[start:start + count]
+        head = start + count % self.size
+        return column[head:start + self.size] + column[start:head]
+
+    def _recent(self, slot: int, window: Optional[float], now: Optional[float],
+                *columns: array) -> list[array]:
+        '''Значения колонок сайта за последние window секунд в хронологическом порядке.
+        Каждая колонка копируется один раз'''
+        skip = 0
+        if window is not None:
+            since = (now or time.time()) - window
+            skip = sum(1 for ts in self._window(self.timestamps, slot) if ts < since)
+        return [self._window(column, slot)[skip:] for column in columns]
+
+    def last_statuses(self, url: str, count: int) -> array:
+        '''Последние count статусов сайта в хронологическом порядке'''
+        if url not in self.slots:
+            return array('h')
+        return self._window(self.statuses, self.slots[url])[-count:]
+
+    def percentile(self, q: float, window: Optional[float] = None,
+                   now: Optional[float] = None) -> dict[str, float]:
+        '''Перцентиль задержки успешных проверок, по каждому сайту'''
+        result = {}
+        for url, slot in self.slots.items():
+            statuses, latencies = self._recent(slot, window, now, self.statuses, self.latencies)
+            result[url] = _percentile([lat for lat, st in zip(latencies, statuses) if st == 200], q)
+        return result
+
+    def phase_percentile(self, phase: str, q: float, window: Optional[float] = None,
+                         now: Optional[float] = None) -> dict[str, float]:
+        '''Перцентиль времени фазы запроса (dns, connect), по каждому сайту'''
+        result = {}
+        for url, slot in self.slots.items():
+            [timings] = self._recent(slot, window, now, self.phases[phase])
+            result[url] = _percentile([value for value in timings if not math.isnan(value)], q)
+        return result
+
+    def uptime(self, window: Optional[float] = None,
+               now: Optional[float] = None) -> dict[str, float]:
+        '''Доля проверок со статусом 200'''
+        result = {}
+        for url, slot in self.slots.items():
+            [statuses] = self._recent(slot, window, now, self.statuses)
+            result[url] = statuses.count(200) / len(statuses) if statuses else math.nan
+        return result
+
+    def flap_rate(self, window: Optional[float] = None,
+                  now: Optional[float] = None) -> dict[str, float]:
+        '''Доля соседних проверок, между которыми сайт сменил состояние UP/DOWN'''
+        result = {}
+        for url, slot in self.slots.items():
+            [statuses] = self._recent(slot, window, now, self.statuses)
+            if len(statuses) < 2:
+                result[url] = 0.0
+                continue
+            changes = sum(1 for prev, cur in zip(statuses, statuses[1:])
+                          if (prev == 200) != (cur == 200))
+            result[url] = changes / (len(statuses) - 1)
+        return result
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return math.nan
+    values = sorted(values)
+    rank = (len(values) - 1) * q / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return values[low] + (values[high] - values[low]) * (rank - low)
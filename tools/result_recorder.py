@@ -0,0 +1,32 @@
+import json
+from typing import Iterator
+
+from aiohttp_requests.request import CheckResult
+
+
+class ResultRecorder:
+    '''Пишет каждый результат проверки строкой JSONL вместе с тем, откуда пришла проверка
+    (cycle, probe, recovery, group_recovery), чтобы её можно было проиграть заново'''
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def record(self, result: CheckResult, kind: str) -> None:
+        if self.file is None:
+            self.file = open(self.path, 'a', buffering=1)
+        self.file.write(json.dumps({**result._asdict(), 'kind': kind}, default=str) + '\n')
+
+    def close(self) -> None:
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def read_recording(path) -> Iterator[tuple[CheckResult, str]]:
+    '''Результаты в порядке checked_at; запись дописывается по завершении проверки, а не по старту'''
+    with open(path, 'r') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    rows.sort(key=lambda row: row['checked_at'])
+    for row in rows:
+        kind = row.pop('kind', 'cycle')
+        yield CheckResult(**row), kind
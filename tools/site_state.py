@@ -0,0 +1,109 @@
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from typing import Optional
+
+from tools.result_history import ResultHistory
+
+
+class SiteStatus(Enum):
+    UP = 'UP'
+    DOWN = 'DOWN'
+    FLAPPING = 'FLAPPING'
+
+
+@dataclass
+class SiteState:
+    outcomes: deque
+    status: SiteStatus = SiteStatus.UP
+    settled: SiteStatus = SiteStatus.UP
+    consecutive_successes: int = 0
+    consecutive_failures: int = 0
+    escalated: bool = False
+
+
+class SiteStateMachine:
+    '''Состояние сайта с гистерезисом:
+    DOWN - failures_to_down неудачных из последних failure_window проверок,
+    UP - successes_to_up успешных подряд,
+    FLAPPING - доля смен UP/DOWN за последние flap_window проверок не ниже flap_start_rate,
+    выход из FLAPPING - когда доля опускается до flap_stop_rate,
+    либо в DOWN после flapping_failures_to_down неудачных подряд.
+    Сайт, упавший так из FLAPPING, не возвращается в FLAPPING и считается поднявшимся,
+    только когда доля смен тоже опустилась до flap_stop_rate.
+    Доля смен считается по ResultHistory, куда результат должен быть записан до record'''
+    def __init__(self,
+                 history: ResultHistory,
+                 failures_to_down=1,
+                 failure_window=1,
+                 successes_to_up=1,
+                 flap_window=10,
+                 flap_start_rate=0.5,
+                 flap_stop_rate=0.25,
+                 flapping_failures_to_down=3):
+        if flap_window >= history.size:
+            raise ValueError(f"flap_window {flap_window} must be less than history size {history.size}")
+        self.history = history
+        self.failures_to_down = failures_to_down
+        self.failure_window = max(failure_window, failures_to_down)
+        self.successes_to_up = successes_to_up
+        self.flap_window = flap_window
+        self.flap_start_rate = flap_start_rate
+        self.flap_stop_rate = flap_stop_rate
+        self.flapping_failures_to_down = flapping_failures_to_down
+        self.states: dict[str, SiteState] = {}
+
+    def get(self, url: str) -> SiteState:
+        if url not in self.states:
+            self.states[url] = SiteState(outcomes=deque(maxlen=self.failure_window))
+        return self.states[url]
+
+    def status(self, url: str) -> SiteStatus:
+        return self.get(url).status
+
+    def reset(self, url: str) -> None:
+        self.states.pop(url, None)
+
+    def flap_rate(self, url: str) -> float:
+        '''Незаполненная часть окна считается проверками без смены состояния'''
+        if not self.flap_window:
+            return 0.0
+        statuses = self.history.last_statuses(url, self.flap_window + 1)
+        changes = sum(1 for prev, cur in zip(statuses, statuses[1:])
+                      if (prev == 200) != (cur == 200))
+        return changes / self.flap_window
+
+    def record(self, url: str, ok: bool) -> Optional[SiteStatus]:
+        '''Учитывает результат проверки и возвращает новый статус, если он сменился'''
+        state = self.get(url)
+        changed = state.outcomes and state.outcomes[-1] != ok
+        state.outcomes.append(ok)
+        state.consecutive_successes = state.consecutive_successes + 1 if ok else 0
+        state.consecutive_failures = 0 if ok else state.consecutive_failures + 1
+
+        rate = self.flap_rate(url)
+        if state.settled == SiteStatus.UP and state.outcomes.count(False) >= self.failures_to_down:
+            state.settled = SiteStatus.DOWN
+        elif (state.settled == SiteStatus.DOWN and state.consecutive_successes >= self.successes_to_up
+              and (not state.escalated or rate <= self.flap_stop_rate)):
+            state.settled = SiteStatus.UP
+            state.escalated = False
+            state.outcomes.clear()
+            state.outcomes.append(ok)
+
+        if state.status == SiteStatus.FLAPPING:
+            if state.consecutive_failures >= self.flapping_failures_to_down:
+                # Мигающий сайт упал окончательно - не ждём, пока опустеет окно
+                state.settled = SiteStatus.DOWN
+                state.escalated = True
+            elif rate > self.flap_stop_rate:
+                return None
+        elif changed and self.flap_window and rate >= self.flap_start_rate and not state.escalated:
+            # Входим в FLAPPING только на смене состояния, чтобы лежащий сайт не считался мигающим
+            state.status = SiteStatus.FLAPPING
+            return state.status
+
+        if state.status != state.settled:
+            state.status = state.settled
+            return state.status
+        return None
@@ -1,7 +1,8 @@
 from datetime import datetime, timedelta, timezone
 
-def calculate_downtime(down_since: dict, url) -> str:
-    downtime = datetime.now(timezone.utc) - down_since.get(url, datetime.now(timezone.utc))
+def calculate_downtime(down_since: dict, url, now: datetime = None) -> str:
+    now = now or datetime.now(timezone.utc)
+    downtime = now - down_since.get(url, now)
     if downtime < timedelta(0):
         downtime = timedelta(0)
     return str(downtime).split('.')[0]